@@ -3,39 +3,35 @@ from __future__ import annotations
 
 from pathlib import Path
 from loguru import logger
-from datetime import datetime
-from zoneinfo import ZoneInfo  # Python 3.9+
 
 import sys
 
-# JST のタイムスタンプを extra に差し込むパッチ
-def _inject_jst(record):
-    record["extra"]["jst"] = datetime.now(ZoneInfo("Asia/Tokyo")).strftime("%Y-%m-%d %H:%M:%S")
-
-# 共通フォーマット：extra[jst] を使う
-FORMAT = "<green>{extra[jst]}</green> | <level>{level}</level> | {message}"
+# 共通フォーマット：loguru 組み込みの {time} を使う
+# （以前はレコードごとに datetime.now(ZoneInfo) を呼ぶ patch を使っていたが、
+#   loguru はレコード時刻を1回だけ確定して自前でフォーマットするため、
+#   Python レベルの datetime 生成＋strftime が毎レコード走らない。
+#   実行環境は JST 前提＝ローカル時刻がそのまま JST になる）
+FORMAT = "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level}</level> | {message}"
 
 def setup_logger(log_file: Path):
     logger.remove()
 
-    # 各ログレコードに JST を注入
-    patched = logger.patch(_inject_jst)
-
     # コンソール
-    patched.add(
+    logger.add(
         sys.stderr,
         level="INFO",
         format=FORMAT,
     )
 
-    # ファイル
-    patched.add(
+    # ファイル（enqueue=True: 書き込みは背後のワーカーに任せ、呼び出し側を待たせない）
+    logger.add(
         log_file,
         level="INFO",
         rotation="00:00",
         retention="30 days",
         encoding="utf-8",
         format=FORMAT,
+        enqueue=True,
     )
 
-    return patched
+    return logger
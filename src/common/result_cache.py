@@ -0,0 +1,65 @@
+# src/common/result_cache.py
+from __future__ import annotations
+
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional
+
+# 保持期間はログの retention（30日）に合わせる
+CACHE_TTL_SECONDS = 30 * 24 * 60 * 60
+
+
+class ResultCache:
+    """
+    (Message-ID, 設定ハッシュ) をキーにフィルタ判定結果を実行をまたいで持ち越すキャッシュ。
+
+    スケジューラは毎分同じ UNSEEN 集合を再取得するため、前回と同じメールの
+    デコード・正規化・キーワード照合・除外CSVへの重複追記をやり直さないための永続メモ。
+    設定が変わるとハッシュが変わり、自然に再判定される。
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS filter_results ("
+            " msg_id TEXT PRIMARY KEY,"
+            " config_hash TEXT,"
+            " pass_through INTEGER,"
+            " reason TEXT,"
+            " detail TEXT,"
+            " ts REAL)"
+        )
+        # 期限切れエントリの掃除（オープン時に1回だけ）
+        self._conn.execute(
+            "DELETE FROM filter_results WHERE ts < ?",
+            (time.time() - CACHE_TTL_SECONDS,),
+        )
+        self._conn.commit()
+
+    def get(self, msg_id: str, config_hash: str) -> Optional[tuple[bool, Optional[str], Optional[str]]]:
+        """ヒットすれば (pass_through, reason, detail) を返す。Message-ID 無しは常にミス。"""
+        if not msg_id:
+            return None
+        row = self._conn.execute(
+            "SELECT pass_through, reason, detail FROM filter_results"
+            " WHERE msg_id = ? AND config_hash = ?",
+            (msg_id, config_hash),
+        ).fetchone()
+        if row is None:
+            return None
+        return (bool(row[0]), row[1] or None, row[2] or None)
+
+    def put(self, msg_id: str, config_hash: str,
+            pass_through: bool, reason: Optional[str], detail: Optional[str]) -> None:
+        if not msg_id:
+            return
+        self._conn.execute(
+            "INSERT OR REPLACE INTO filter_results VALUES (?, ?, ?, ?, ?, ?)",
+            (msg_id, config_hash, int(pass_through), reason or "", detail or "", time.time()),
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
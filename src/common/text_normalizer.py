@@ -1,23 +1,59 @@
 from __future__ import annotations
 import re
 import unicodedata
+from functools import lru_cache
+from html import unescape as _html_unescape
 from typing import Optional
 
-try:
-    import jaconv  # あると精度UP（なくても動く）
-except Exception:
-    jaconv = None
 
-try:
-    from bs4 import BeautifulSoup
-except Exception:
-    BeautifulSoup = None
+# 重量級の依存は実際に使う経路まで import を遅延する
+# （HTMLもかな変換も不要なジョブの起動を軽くする）
+@lru_cache(maxsize=1)
+def _get_jaconv():
+    try:
+        import jaconv  # あると精度UP（なくても動く）
+    except Exception:
+        return None
+    return jaconv
+
+
+@lru_cache(maxsize=1)
+def _get_beautifulsoup():
+    try:
+        from bs4 import BeautifulSoup
+    except Exception:
+        return None
+    return BeautifulSoup
+
+
+# ひらがな→カタカナ変換表（jaconv不在時のフォールバック用、C実装のtranslateで適用）
+_HIRA2KATA = {cp: cp + 0x60 for cp in range(ord("ぁ"), ord("ゖ") + 1)}
+
+# 連続空白の圧縮用（normalize_text のホットパスなので一度だけコンパイル）
+_WS_RE = re.compile(r"\s+")
+
+# タグ除去用（html_to_text の高速パス）
+# タグらしいトークン（要素・コメント・<!DOCTYPE 等）だけを対象にする。
+# 本文中の裸の "<"（"1 < 2" や "Foo <foo@example.com>" など）を
+# タグ扱いで消さないため、< の直後が / か英字か !・コメントの場合のみ除去し、
+# 残った "<" は下の取り切れ判定で BeautifulSoup に回す
+_SCRIPT_STYLE_RE = re.compile(r"(?is)<(script|style)[^>]*>.*?</\1>")
+_TAGS_RE = re.compile(r"(?s)<!--.*?-->|<![^>]*>|</?[A-Za-z][^>]*>")
 
 
 def html_to_text(html: str) -> str:
     """HTML文字列から可読テキストを抽出"""
     if not html:
         return ""
+    # 高速パス：正規表現でタグを落とす（BeautifulSoupのノード生成を回避）
+    # CDATAなど正規表現で安全に扱えないものだけ本格パースに回す
+    if "<![CDATA[" not in html:
+        text = _SCRIPT_STYLE_RE.sub(" ", html)
+        text = _TAGS_RE.sub(" ", text)
+        if "<" not in text:  # タグを取り切れたら成功
+            # BeautifulSoup と同様に文字参照（&amp; や &#NNNN;）も復元する
+            return _html_unescape(text)
+    BeautifulSoup = _get_beautifulsoup()
     if BeautifulSoup:
         soup = BeautifulSoup(html, "html.parser")
         # script/style除去
@@ -26,7 +62,7 @@ def html_to_text(html: str) -> str:
         text = soup.get_text(separator=" ")
     else:
         # フォールバック（簡易除去）
-        text = re.sub(r"<[^>]+>", " ", html)
+        text = _html_unescape(_TAGS_RE.sub(" ", html))
     return text
 
 
@@ -48,25 +84,28 @@ def normalize_text(
 
     s = text
 
+    # 純ASCIIならNFKCもかな変換も不要（単一のC実装チェックで判定できる）
+    if s.isascii():
+        return " ".join(s.lower().split()) if trim_spaces else s.lower()
+
     # 全角→半角。句読点や記号も揃う（数字・英字・記号の揺れ対策）
     if to_half_width:
         s = unicodedata.normalize("NFKC", s)
 
     # ひらがな/カタカナ統一（今回はカタカナへ統一）
     if unify_kana:
+        jaconv = _get_jaconv()
         if jaconv:
             s = jaconv.hira2kata(s)
         else:
             # jaconv不在時の簡易対応（ひらがな→カタカナ）
-            s = "".join(
-                chr(ord(ch) + 0x60) if "ぁ" <= ch <= "ゖ" else ch for ch in s
-            )
+            s = s.translate(_HIRA2KATA)
 
     # ASCIIは小文字化（英語混在の揺れ対策）
     s = s.lower()
 
     # 余分な空白を1個に圧縮
     if trim_spaces:
-        s = re.sub(r"\s+", " ", s).strip()
+        s = _WS_RE.sub(" ", s).strip()
 
     return s
@@ -2,11 +2,14 @@
 from __future__ import annotations
 
 import os
+import re
 from pathlib import Path
 from typing import Optional
 from dotenv import load_dotenv
 
 # 1) .env を読み込む（プロジェクト直下を優先）
+#    このモジュールは IMAP_* 以外に DATA_ROOT や TZ なども参照するため、
+#    環境変数の有無で読み込みをスキップせず常に読む（コストは初回のみで微小）
 load_dotenv()
 
 def _env(key: str, default: Optional[str] = None) -> str:
@@ -33,11 +36,15 @@ for d in (DATA_ROOT, MAIL_ARCHIVE_DIR, LOG_DIR):
     d.mkdir(parents=True, exist_ok=True)
 
 # 5) 便利ヘルパ
+# ファイル名に使えない文字（英数・ハイフン・アンダースコア以外）を "_" に置換する
+# （\w はUnicode英数字を含むため、従来の isalnum() 判定と同等）
+_UNSAFE_CHARS_RE = re.compile(r"[^\w\-]")
+
 def path_for_mail_text(file_stem: str) -> Path:
     """
     例: path_for_mail_text("20251008_123456_UID9999") -> data/mail_archive/imap/20251008_123456_UID9999.txt
     """
-    safe = "".join(c if c.isalnum() or c in ("-", "_") else "_" for c in file_stem)
+    safe = _UNSAFE_CHARS_RE.sub("_", file_stem)
     return MAIL_ARCHIVE_DIR / f"{safe}.txt"
 
 def require_ready() -> None:
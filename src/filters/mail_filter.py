@@ -1,23 +1,46 @@
 from __future__ import annotations
 import sys
-import email
-from email.header import decode_header
+from dataclasses import dataclass, field
 from email.message import Message
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional
 
-import yaml
 from loguru import logger
 
 from src.common.text_normalizer import html_to_text, normalize_text
 
+try:
+    import ahocorasick  # 複数キーワードを1パスで照合（なくても動く）
+except Exception:
+    ahocorasick = None
+
+try:
+    import hyperscan  # 任意依存：キーワードが大量な場合のSIMD DFA照合（なくても動く）
+except Exception:
+    hyperscan = None
+
+# コールバックが True を返してスキャンを打ち切ると、この例外で通知される
+_HS_SCAN_TERMINATED = getattr(hyperscan, "ScanTerminated", ()) if hyperscan else ()
+
+# ブロックリストがこの件数を超えたら Hyperscan DB を併用する
+HYPERSCAN_MIN_KEYWORDS = 64
+
 
 # ===== ロガー設定（フィルタ専用ログ）=====
 BASE_DIR = Path(__file__).resolve().parents[2]  # src -> fe_scraping ルート
 LOG_DIR = BASE_DIR / "logs"
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 
-# 重複ハンドラ防止
+
+# スケジューラと同一プロセスで import されてもログが混ざらないよう、
+# このモジュールのレコードに task=filtering を bind し、シンク側も同条件で絞る
+# （filtering.log にスケジューラのログが入らず、scheduler.log にも判定ログが漏れない）
+def _is_filtering(record) -> bool:
+    return record["extra"].get("task") == "filtering"
+
+
+# 重複ハンドラ防止（loguru 既定の stderr シンクを外す）
 logger.remove()
 
 # コンソール出力（必要な場合のみ）
@@ -26,129 +49,233 @@ logger.add(
     level="INFO",
     # ← 中括弧は 1 個でOK
     format="[{time:YYYY-MM-DD HH:mm:ss}] {message}",
+    filter=_is_filtering,
     backtrace=False,
     diagnose=False,
 )
 
 # ファイル出力（本命）
+# enqueue=True: フィルタ判定のたびのディスク書き込みで判定ループを止めない
 logger.add(
     LOG_DIR / "filtering.log",
     rotation="1 day",
     level="INFO",
     # ← こちらも同様
     format="[{time:YYYY-MM-DD HH:mm:ss}] {message}",
+    filter=_is_filtering,
+    enqueue=True,
 )
 
+# 以降このモジュールが出すレコードはすべて task=filtering 付きになる
+logger = logger.bind(task="filtering")
+
 
 
 # ===== 設定読み込み =====
 def load_filter_config(path: Optional[Path] = None) -> Dict:
+    # yaml はここでしか使わないので import を遅延（起動コスト削減）
+    import yaml
+
+    # libyaml があれば C 実装のローダーを使う（純Python版より数倍速い）
+    try:
+        from yaml import CSafeLoader as _YamlLoader
+    except ImportError:
+        from yaml import SafeLoader as _YamlLoader
+
     if path is None:
         path = BASE_DIR / "config" / "filtering.yml"
     with path.open("r", encoding="utf-8") as f:
-        return yaml.safe_load(f) or {}
+        return yaml.load(f, Loader=_YamlLoader) or {}
 
 
-# ===== ユーティリティ =====
-def _decode_mime_words(value: Optional[str]) -> str:
-    """=?utf-8?B?...?= のようなMIMEエンコードをデコード"""
-    if not value:
-        return ""
-    try:
-        parts = decode_header(value)
-        decoded = []
-        for text, charset in parts:
-            if isinstance(text, bytes):
-                decoded.append(text.decode(charset or "utf-8", errors="ignore"))
-            else:
-                decoded.append(text)
-        return "".join(decoded)
-    except Exception:
-        return value or ""
-
-
-def _extract_subject_and_body(msg: Message) -> Tuple[str, str]:
-    # 件名
-    subject_raw = msg.get("Subject", "")
-    subject = _decode_mime_words(subject_raw)
-
-    # 本文（text/plain優先、なければtext/html）
-    text_plain_parts: List[str] = []
-    text_html_parts: List[str] = []
-
-    if msg.is_multipart():
-        for part in msg.walk():
-            ctype = (part.get_content_type() or "").lower()
-            disp = (part.get("Content-Disposition") or "").lower()
-            if ctype.startswith("text/") and "attachment" not in disp:
-                try:
-                    payload = part.get_payload(decode=True) or b""
-                    charset = part.get_content_charset() or "utf-8"
-                    text = payload.decode(charset, errors="ignore")
-                except Exception:
-                    continue
-                if ctype == "text/plain":
-                    text_plain_parts.append(text)
-                elif ctype == "text/html":
-                    text_html_parts.append(text)
-    else:
-        # 単一パート
-        try:
-            payload = msg.get_payload(decode=True) or b""
-            charset = msg.get_content_charset() or "utf-8"
-            text = payload.decode(charset, errors="ignore")
-        except Exception:
-            text = ""
-        ctype = (msg.get_content_type() or "").lower()
-        if ctype == "text/plain":
-            text_plain_parts.append(text)
-        elif ctype == "text/html":
-            text_html_parts.append(text)
+@dataclass(frozen=True)
+class PreparedConfig:
+    """正規化済みのフィルタ設定（メッセージごとの再計算を避けるため事前計算済み）"""
+    blocked_exts: frozenset[str]
+    keyword_norms: tuple[str, ...]
+    norm_flags: tuple[bool, bool, bool]  # (to_half_width, unify_kana, trim_spaces)
+    # Aho-Corasick オートマトン（pyahocorasick 不在時は None → 逐次 in 検索）
+    keyword_ac: Optional[object] = field(default=None, compare=False, repr=False)
+    # Hyperscan DB（hyperscan 不在 or キーワード少数時は None）
+    keyword_db: Optional[object] = field(default=None, compare=False, repr=False)
+
+
+@lru_cache(maxsize=4)
+def _prepared_config(path: Path, mtime: float) -> PreparedConfig:
+    # mtime をキーに含めることで、設定ファイル更新時はキャッシュミスして再読込される
+    config = load_filter_config(path)
+
+    norm_conf = (config.get("normalization", {}) or {})
+    to_half = bool(norm_conf.get("to_half_width", True))
+    unify_k = bool(norm_conf.get("unify_kana", True))
+    trim_sp = bool(norm_conf.get("trim_spaces", True))
 
-    body = ""
-    if text_plain_parts:
-        body = "\n".join(text_plain_parts)
-    elif text_html_parts:
-        body = html_to_text("\n".join(text_html_parts))
+    blocked_exts = frozenset(
+        (config.get("attachments", {}) or {}).get("blocked_extensions", [])
+    )
+    keywords = (config.get("keywords", {}) or {}).get("blocklist", [])
+    keyword_norms = tuple(
+        kw for kw in (normalize_text(k, to_half, unify_k, trim_sp) for k in keywords) if kw
+    )
+
+    # キーワードが複数あれば1パスで照合できるオートマトンを事前構築
+    keyword_ac = None
+    if ahocorasick and keyword_norms:
+        keyword_ac = ahocorasick.Automaton()
+        for kw in keyword_norms:
+            keyword_ac.add_word(kw, kw)
+        keyword_ac.make_automaton()
+
+    # ブロックリストが大きいときは Hyperscan のDFAにコンパイル（SIMDで1パス照合）
+    keyword_db = None
+    if hyperscan and len(keyword_norms) > HYPERSCAN_MIN_KEYWORDS:
+        import re as _re
+        keyword_db = hyperscan.Database()
+        keyword_db.compile(
+            expressions=tuple(_re.escape(kw).encode("utf-8") for kw in keyword_norms),
+            ids=tuple(range(len(keyword_norms))),
+            flags=[hyperscan.HS_FLAG_UTF8] * len(keyword_norms),
+        )
+
+    return PreparedConfig(
+        blocked_exts=blocked_exts,
+        keyword_norms=keyword_norms,
+        norm_flags=(to_half, unify_k, trim_sp),
+        keyword_ac=keyword_ac,
+        keyword_db=keyword_db,
+    )
+
+
+def prepared_filter_config(path: Optional[Path] = None) -> PreparedConfig:
+    """YAML解析＋キーワード正規化を済ませた設定を返す（mtime 単位でメモ化）"""
+    if path is None:
+        path = BASE_DIR / "config" / "filtering.yml"
+    return _prepared_config(path, path.stat().st_mtime)
 
-    return subject, body
+
+def config_hash(config: PreparedConfig) -> str:
+    """判定に効く設定内容の指紋（結果キャッシュのキー用）"""
+    import hashlib
+    payload = repr((sorted(config.blocked_exts), config.keyword_norms, config.norm_flags))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
 
 
 IMAGE_EXTS = {"jpg", "jpeg", "png", "gif", "bmp", "webp"}
 IMAGE_MIME_PREFIX = "image/"
 
 
-def _detect_blocked_attachment(msg: Message, blocked_exts: set[str]) -> Optional[str]:
+@dataclass
+class ScanResult:
+    """msg.walk() 1回分で集めたメッセージ情報（件名・本文・添付判定）"""
+    subject_raw: str
+    plain_parts: List[str]
+    html_parts: List[str]
+    blocked_file: Optional[str]  # ブロック対象の添付ファイル名（なければ None）
+    has_attachments: bool
+
+    @property
+    def body(self) -> str:
+        """本文テキスト（text/plain優先、なければtext/htmlをテキスト化）"""
+        if self.plain_parts:
+            return "\n".join(self.plain_parts)
+        if self.html_parts:
+            return html_to_text("\n".join(self.html_parts))
+        return ""
+
+
+# バイト連結してから decode しても安全な charset（0x0A 単体が常に改行になるもの）。
+# utf-16/utf-32 は1文字が複数バイトで 0x0A 単体が不正、iso-2022-jp は
+# エスケープ状態を持つため、これら以外はパートごとに decode する。
+_CONCAT_SAFE_CHARSETS = {
+    "ascii", "us-ascii", "utf-8", "utf8",
+    "iso-8859-1", "latin-1", "latin1",
+    "shift_jis", "shift-jis", "sjis", "cp932",
+    "euc-jp", "euc_jp",
+}
+
+
+def _decode_text_chunks(chunks: List[tuple[str, bytes]]) -> List[str]:
     """
-    ブロック対象の添付が見つかればファイル名を返す。
-    画像（image/*）は判定から除外。
+    (charset, payload) の列を decode する。連結が安全な charset では
+    連続する同一charsetの payload をまとめて1回で decode し、
+    パートごとの str 生成と decode 呼び出しを節約する。
     """
-    for part in msg.walk():
-        filename = part.get_filename()
-        if not filename:
-            continue
+    out: List[str] = []
+    i = 0
+    while i < len(chunks):
+        charset = chunks[i][0]
+        j = i + 1
+        if charset.lower() in _CONCAT_SAFE_CHARSETS:
+            while j < len(chunks) and chunks[j][0] == charset:
+                j += 1
+        joined = chunks[i][1] if j == i + 1 else b"\n".join(c[1] for c in chunks[i:j])
+        try:
+            out.append(joined.decode(charset, errors="ignore"))
+        except Exception:
+            pass  # 不明なcharsetはパートごと読み飛ばす（従来と同じ扱い）
+        i = j
+    return out
 
-        # 画像は除外対象外
-        ctype = (part.get_content_type() or "").lower()
-        if ctype.startswith(IMAGE_MIME_PREFIX):
-            continue
 
-        fname = _decode_mime_words(filename)
-        ext = fname.rsplit(".", 1)[-1].lower() if "." in fname else ""
+def _scan_message(msg: Message, blocked_exts: frozenset[str] | set[str]) -> ScanResult:
+    """
+    メッセージを1回だけ走査して、件名・本文パート・添付判定をまとめて返す。
+    （以前は本文抽出・添付検出・添付有無で walk() を計4回行っていた）
+    画像（image/*）はブロック判定から除外。
 
-        if ext in IMAGE_EXTS:
-            continue
+    前提: msg は policy=email.policy.default でパース済みであること
+    （件名・ファイル名は MIME ワードがデコード済みの str で取れる）。
+    """
+    subject = str(msg.get("Subject", "") or "")
 
-        if ext in blocked_exts:
-            return fname
+    # decode は走査後に charset 単位でまとめて行う（(charset, bytes) で貯める）
+    plain_chunks: List[tuple[str, bytes]] = []
+    html_chunks: List[tuple[str, bytes]] = []
+    blocked_file: Optional[str] = None
+    has_attachments = False
 
-        # Content-Disposition のみでのファイル名は必要に応じて拡張可
-    return None
+    # walk() は非マルチパートでもメッセージ自身を1件返すため、単一ループで両方を扱える
+    for part in msg.walk():
+        ctype = (part.get_content_type() or "").lower()
+        disp = (part.get("Content-Disposition") or "").lower()
+
+        # 添付有無フラグは disposition が正確に attachment の場合のみ
+        # （inline; filename=... を添付扱いしない。部分一致は本文パート除外専用）
+        if part.get_content_disposition() == "attachment":
+            has_attachments = True
+
+        # 添付ファイルのブロック判定
+        fname = part.get_filename()
+        if fname and blocked_file is None and not ctype.startswith(IMAGE_MIME_PREFIX):
+            # rpartition はC実装の1回走査（rsplit のリスト生成＋ in 走査より軽い）
+            _, dot, ext = fname.rpartition(".")
+            ext = ext.lower() if dot else ""
+            if ext not in IMAGE_EXTS and ext in blocked_exts:
+                blocked_file = fname
+            # Content-Disposition のみでのファイル名は必要に応じて拡張可
+
+        # 本文パート収集（text/plain優先、なければtext/html）
+        if ctype.startswith("text/") and "attachment" not in disp:
+            try:
+                payload = part.get_payload(decode=True) or b""
+                charset = part.get_content_charset() or "utf-8"
+            except Exception:
+                continue
+            if ctype == "text/plain":
+                plain_chunks.append((charset, payload))
+            elif ctype == "text/html":
+                html_chunks.append((charset, payload))
+
+    return ScanResult(
+        subject_raw=subject,
+        plain_parts=_decode_text_chunks(plain_chunks),
+        html_parts=_decode_text_chunks(html_chunks),
+        blocked_file=blocked_file,
+        has_attachments=has_attachments,
+    )
 
 
 # ===== 判定結果 =====
-from dataclasses import dataclass
-
 @dataclass
 class FilterResult:
     pass_through: bool  # 通過なら True
@@ -157,42 +284,75 @@ class FilterResult:
     subject: str = ""
 
 
+def match_keyword(haystack: str, config: PreparedConfig) -> Optional[str]:
+    """正規化済みテキストに対してブロックキーワードを照合し、最初のヒット語を返す"""
+    if config.keyword_db is not None:
+        # Hyperscan: 初ヒットでコールバックから True を返して走査を打ち切る
+        hits: list[int] = []
+        scan_ok = True
+
+        def _on_match(match_id, start, end, flags, ctx):
+            hits.append(match_id)
+            return True
+
+        try:
+            config.keyword_db.scan(haystack.encode("utf-8"), match_event_handler=_on_match)
+        except _HS_SCAN_TERMINATED:
+            pass  # 初ヒットによる打ち切り（正常系）
+        except Exception:
+            # スキャン自体の失敗。ここで None を返すとブロック対象が素通りするため、
+            # 下の Aho-Corasick / 逐次照合にフォールバックする
+            scan_ok = False
+        if hits:
+            return config.keyword_norms[hits[0]]
+        if scan_ok:
+            return None
+    if config.keyword_ac is not None:
+        # Aho-Corasick: 全キーワードを1回の線形走査で照合
+        for _, kw in config.keyword_ac.iter(haystack):
+            return kw
+        return None
+    for kw in config.keyword_norms:
+        if kw in haystack:
+            return kw
+    return None
+
+
 # ===== メイン判定 =====
-def filter_message(msg: Message, config: Dict) -> FilterResult:
+def filter_message(msg: Message, config: PreparedConfig, scan: Optional[ScanResult] = None) -> FilterResult:
     """
     処理順序:
       1) 添付ファイルチェック（即除外）
       2) 件名・本文を正規化
       3) キーワードヒット（即除外）
       4) どちらも無ければ通過
-    """
-    blocked_exts = set((config.get("attachments", {}) or {}).get("blocked_extensions", []))
-    keywords = (config.get("keywords", {}) or {}).get("blocklist", [])
 
-    norm_conf = (config.get("normalization", {}) or {})
-    to_half = bool(norm_conf.get("to_half_width", True))
-    unify_k = bool(norm_conf.get("unify_kana", True))
-    trim_sp = bool(norm_conf.get("trim_spaces", True))
+    config は prepared_filter_config() で事前計算したものを渡す。
+    キーワードの正規化は設定読込時に済んでいるため、ここでは件名・本文のみ正規化する。
+    scan を渡すと走査済みの結果を再利用する（呼び出し側が保存処理でも使う場合）。
+    """
+    to_half, unify_k, trim_sp = config.norm_flags
 
-    # 1) 添付ファイルブロック
-    blocked_file = _detect_blocked_attachment(msg, blocked_exts)
-    subject_raw, body_raw = _extract_subject_and_body(msg)
-    if blocked_file:
-        logger.info(f"除外: attachment (file={blocked_file})")
-        return FilterResult(False, reason="attachment", detail=blocked_file, subject=subject_raw)
+    # 1) 添付ファイルブロック（本文抽出と同じ走査で判定済み）
+    if scan is None:
+        scan = _scan_message(msg, config.blocked_exts)
+    subject_raw = scan.subject_raw
+    body_raw = scan.body
+    if scan.blocked_file:
+        logger.info(f"除外: attachment (file={scan.blocked_file})")
+        return FilterResult(False, reason="attachment", detail=scan.blocked_file, subject=subject_raw)
 
     # 2) 正規化
     subject_norm = normalize_text(subject_raw, to_half, unify_k, trim_sp)
     body_norm = normalize_text(body_raw, to_half, unify_k, trim_sp)
 
-    # 3) キーワード（正規化した本文・件名に対して、正規化したキーワードで部分一致）
-    keyword_norms = [normalize_text(k, to_half, unify_k, trim_sp) for k in keywords]
+    # 3) キーワード（正規化した本文・件名に対して、正規化済みキーワードで部分一致）
     haystack = f"{subject_norm} {body_norm}"
 
-    for kw in keyword_norms:
-        if kw and kw in haystack:
-            logger.info(f"除外: keyword (hit={kw})")
-            return FilterResult(False, reason="keyword", detail=kw, subject=subject_raw)
+    kw = match_keyword(haystack, config)
+    if kw is not None:
+        logger.info(f"除外: keyword (hit={kw})")
+        return FilterResult(False, reason="keyword", detail=kw, subject=subject_raw)
 
     # 4) 通過
     logger.info(f'通過: 案件メール (subject="{subject_raw}")')
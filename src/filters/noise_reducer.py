@@ -2,7 +2,7 @@
 from __future__ import annotations
 import re
 
-_noise_rules = [
+_RAW_RULES = [
     # 署名ブロックの典型
     (r"(?is)\n--+\s*\n.*$", ""),                     # -- 署名
     (r"(?is)\n^={3,}.*$", ""),                       # === 区切り以降
@@ -19,10 +19,28 @@ _noise_rules = [
     (r"\n{3,}", "\n\n"),
 ]
 
+# 先頭から連続する「(?is) かつ置換が空」のルールだけを単一の選択肢パターンに
+# 融合して1回の走査で処理する（本文を9回なめる代わりに4回で済む）。
+# 適用順は変えられない点に注意：On ... wrote: ルールは > 引用行が
+# 消えた後で初めて末尾一致するため、引用行ルールより先に動かせない。
+_FUSABLE = 0
+for _p, _rep in _RAW_RULES:
+    if _rep == "" and _p.startswith("(?is)"):
+        _FUSABLE += 1
+    else:
+        break
+_COMBINED_REMOVE = re.compile(
+    "(?is)" + "|".join(f"(?:{p[len('(?is)'):]})" for p, _ in _RAW_RULES[:_FUSABLE])
+)
+
+# 残りのルール（引用行・On wrote・空行圧縮）はコンパイル済みで元の順に個別適用
+_REST_RULES = [(re.compile(p), rep) for p, rep in _RAW_RULES[_FUSABLE:]]
+
+
 def reduce_noise(text: str) -> str:
     if not text:
         return ""
-    s = text
-    for pat, rep in _noise_rules:
-        s = re.sub(pat, rep, s)
+    s = _COMBINED_REMOVE.sub("", text)
+    for pat, rep in _REST_RULES:
+        s = pat.sub(rep, s)
     return s.strip()
@@ -17,16 +17,23 @@ import email.policy
 import email.header
 import imaplib
 import re
-from typing import Iterable, Optional
+from typing import Optional
 
 from src.config import (
-    IMAP_HOST, IMAP_PORT, IMAP_USER, IMAP_PASS, IMAP_MAILBOX,
+    DATA_ROOT, IMAP_HOST, IMAP_PORT, IMAP_USER, IMAP_PASS, IMAP_MAILBOX,
     path_for_mail_text, require_ready
 )
 
 # === フィルタリング設定 ===
-from src.filters.mail_filter import load_filter_config, filter_message
-FILTER_CONF = load_filter_config()
+from src.filters.mail_filter import (
+    IMAGE_EXTS, ScanResult, _scan_message, prepared_filter_config,
+    filter_message, match_keyword, config_hash
+)
+from src.common.result_cache import ResultCache
+from src.common.text_normalizer import normalize_text
+
+# フィルタ判定の持ち越しキャッシュ（毎分実行で同じ未読メールを再判定しないため）
+RESULT_CACHE_PATH = DATA_ROOT / "mail_archive" / "cache" / "filter_results.sqlite3"
 
 # === ノイズ除外処理 ===
 from src.filters.noise_reducer import reduce_noise
@@ -34,8 +41,23 @@ from src.filters.noise_reducer import reduce_noise
 # === 除外メールCSV出力 ===
 from src.review.exporters import append_excluded
 
+try:
+    import aioimaplib  # 任意依存：FETCHバッチを並行発行する（なくても動く）
+except Exception:
+    aioimaplib = None
+
+
+def _header_str(msg: email.message.Message, name: str) -> str:
+    """policy=default でパース済みメッセージのヘッダをデコード済み str で返す"""
+    return str(msg.get(name) or "").strip()
 
-def _decode_header(value: Optional[str]) -> str:
+
+def _decode_mime_words(value: Optional[str]) -> str:
+    """
+    =?utf-8?B?...?= のようなMIMEワードをデコード。
+    policy=default でパースしたヘッダは不要だが、BODYSTRUCTURE 応答から
+    取り出した生のファイル名はここを通す必要がある。
+    """
     if not value:
         return ""
     parts = email.header.decode_header(value)
@@ -65,62 +87,20 @@ def _message_datetime(msg: email.message.Message) -> dt.datetime:
     return d
 
 
-def _iter_text_parts(msg: email.message.Message) -> Iterable[str]:
-    """text/plain を優先。無ければ text/html を超簡易テキスト化して返す。"""
-    plain = []
-    html = []
-    if msg.is_multipart():
-        for part in msg.walk():
-            ctype = part.get_content_type()
-            disp = (part.get_content_disposition() or "").lower()
-            if disp == "attachment":
-                continue
-            if ctype == "text/plain":
-                try:
-                    plain.append(part.get_content().strip())
-                except Exception:
-                    payload = part.get_payload(decode=True) or b""
-                    plain.append(payload.decode(part.get_content_charset() or "utf-8", "replace").strip())
-            elif ctype == "text/html":
-                try:
-                    html.append(part.get_content())
-                except Exception:
-                    payload = part.get_payload(decode=True) or b""
-                    html.append(payload.decode(part.get_content_charset() or "utf-8", "replace"))
-    else:
-        ctype = msg.get_content_type()
-        if ctype == "text/plain":
-            try:
-                plain.append(msg.get_content().strip())
-            except Exception:
-                payload = msg.get_payload(decode=True) or b""
-                plain.append(payload.decode(msg.get_content_charset() or "utf-8", "replace").strip())
-        elif ctype == "text/html":
-            try:
-                html.append(msg.get_content())
-            except Exception:
-                payload = msg.get_payload(decode=True) or b""
-                html.append(payload.decode(msg.get_content_charset() or "utf-8", "replace"))
-
-    if plain:
-        return [p for p in plain if p]
-
-    # HTML -> 簡易テキスト化
-    def _html_to_text(s: str) -> str:
-        s = re.sub(r"(?is)<(script|style).*?>.*?</\1>", "", s)
-        s = re.sub(r"(?is)<br\s*/?>", "\n", s)
-        s = re.sub(r"(?is)</p\s*>", "\n\n", s)
-        s = re.sub(r"(?is)<.*?>", "", s)
-        return re.sub(r"\n{3,}", "\n\n", s).strip()
-
-    return [_html_to_text(h) for h in html if h]
+def _html_to_text(s: str) -> str:
+    """保存用の超簡易HTMLテキスト化（改行をある程度保つ）"""
+    s = re.sub(r"(?is)<(script|style).*?>.*?</\1>", "", s)
+    s = re.sub(r"(?is)<br\s*/?>", "\n", s)
+    s = re.sub(r"(?is)</p\s*>", "\n\n", s)
+    s = re.sub(r"(?is)<.*?>", "", s)
+    return re.sub(r"\n{3,}", "\n\n", s).strip()
 
 
-def _has_attachments(msg: email.message.Message) -> bool:
-    for part in msg.walk():
-        if (part.get_content_disposition() or "").lower() == "attachment":
-            return True
-    return False
+def _body_from_scan(scan: ScanResult) -> str:
+    """走査結果から保存用本文を組み立てる（text/plain優先）"""
+    if scan.plain_parts:
+        return "\n\n".join(p.strip() for p in scan.plain_parts if p.strip())
+    return "\n\n".join(_html_to_text(h) for h in scan.html_parts if h)
 
 
 def _connect() -> imaplib.IMAP4_SSL:
@@ -156,13 +136,169 @@ def _search_uids(m: imaplib.IMAP4_SSL, args) -> list[bytes]:
     return uids
 
 
-def _save_text(uid: bytes, msg: email.message.Message) -> str:
+# 1回のFETCHでまとめて取得するUID数（往復回数を N 回 → N/50 回に削減）
+FETCH_BATCH_SIZE = 50
+
+# FETCH応答から UID を取り出す（応答順はリクエスト順と一致しない場合がある）
+_FETCH_UID_RE = re.compile(rb"UID (\d+)")
+
+
+def _fetch_messages(m: imaplib.IMAP4_SSL, uids: list[bytes], parts: str = "(RFC822)"):
+    """
+    UIDをバッチにまとめてFETCHし、(uid, メタ応答bytes, 本体bytes) を uids の順に yield する。
+    1 UID = 1往復だったものを、UIDセット指定で1バッチ=1往復にする。
+    メタ応答には BODYSTRUCTURE など括弧内の属性がそのまま入る。
+    """
+    for i in range(0, len(uids), FETCH_BATCH_SIZE):
+        batch = uids[i:i + FETCH_BATCH_SIZE]
+        uid_set = b",".join(batch)
+        typ, data = m.uid("FETCH", uid_set, parts)
+        if typ != "OK":
+            print(f"[SKIP] FETCH失敗 uids={uid_set.decode()} resp={typ}")
+            continue
+        # 応答の各タプルを UID に対応付ける
+        by_uid: dict[bytes, tuple[bytes, bytes]] = {}
+        for item in data or []:
+            if isinstance(item, tuple) and len(item) >= 2:
+                mt = _FETCH_UID_RE.search(item[0])
+                if mt:
+                    by_uid[mt.group(1)] = (item[0], item[1])
+        for uid in batch:
+            got = by_uid.get(uid)
+            if got is None:
+                print(f"[SKIP] FETCH失敗 uid={uid}")
+                continue
+            yield uid, got[0], got[1]
+
+
+# --async-fetch 時に同時に発行するFETCHバッチ数
+ASYNC_CONCURRENCY = 8
+
+# リテラル（{サイズ}）で終わるメタ行＝次の要素が本体データ
+_LITERAL_TAIL_RE = re.compile(rb"\{\d+\}$")
+
+
+def _fetch_messages_async(uids: list[bytes], parts: str = "(RFC822)") -> list[tuple[bytes, bytes, bytes]]:
+    """
+    aioimaplib で複数のFETCHバッチを並行発行し、(uid, メタ応答bytes, 本体bytes) を
+    uids の順で返す（同期版 _fetch_messages と同じタプル形式）。
+    imaplib は応答待ちの間コマンドを発行できないが、aioimaplib はパイプラインできる
+    ため、RTTの大きいサーバーでバッチ同士の待ち時間が重なる。専用接続を張るので
+    呼び出し元の imaplib セッションには影響しない。
+    """
+    import asyncio
+
+    async def _one(client, sem, batch: list[bytes]) -> dict[bytes, tuple[bytes, bytes]]:
+        uid_set = b",".join(batch).decode()
+        async with sem:
+            resp = await client.uid("fetch", uid_set, parts)
+        by_uid: dict[bytes, tuple[bytes, bytes]] = {}
+        if resp.result != "OK":
+            print(f"[SKIP] FETCH失敗 uids={uid_set} resp={resp.result}")
+            return by_uid
+        # メタ行（{n} で終わる）と直後のリテラルをペアにして UID に対応付ける
+        lines = resp.lines
+        i = 0
+        while i < len(lines):
+            line = bytes(lines[i])
+            if _LITERAL_TAIL_RE.search(line) and i + 1 < len(lines):
+                mt = _FETCH_UID_RE.search(line)
+                if mt:
+                    by_uid[mt.group(1)] = (line, bytes(lines[i + 1]))
+                i += 2
+                continue
+            i += 1
+        return by_uid
+
+    async def _go() -> dict[bytes, tuple[bytes, bytes]]:
+        client = aioimaplib.IMAP4_SSL(host=IMAP_HOST, port=IMAP_PORT)
+        await client.wait_hello_from_server()
+        await client.login(IMAP_USER, IMAP_PASS)
+        await client.examine(IMAP_MAILBOX)  # 読み取り専用選択
+        sem = asyncio.Semaphore(ASYNC_CONCURRENCY)
+        batches = [uids[i:i + FETCH_BATCH_SIZE] for i in range(0, len(uids), FETCH_BATCH_SIZE)]
+        results = await asyncio.gather(*(_one(client, sem, b) for b in batches))
+        try:
+            await client.logout()
+        except Exception:
+            pass
+        merged: dict[bytes, tuple[bytes, bytes]] = {}
+        for r in results:
+            merged.update(r)
+        return merged
+
+    merged = asyncio.run(_go())
+    out = []
+    for uid in uids:
+        got = merged.get(uid)
+        if got is None:
+            print(f"[SKIP] FETCH失敗 uid={uid}")
+            continue
+        out.append((uid, got[0], got[1]))
+    return out
+
+
+# BODYSTRUCTURE 応答から添付ファイル名を拾う簡易パーサ
+# （("NAME" "foo.pdf") / ("FILENAME" "foo.pdf") の形を対象）
+_BS_FILENAME_RE = re.compile(rb'"(?:NAME|FILENAME)"\s+"([^"]*)"', re.IGNORECASE)
+
+# パート先頭の ("TYPE" "SUBTYPE" を拾う（("NAME" "..." のようなパラメータ名は除外する）
+_BS_PART_TYPE_RE = re.compile(rb'\("([A-Za-z]+)"\s+"', re.IGNORECASE)
+_BS_PARAM_TOKENS = {b"NAME", b"FILENAME", b"CHARSET", b"BOUNDARY"}
+
+
+def _part_type_before(meta: bytes, pos: int) -> Optional[bytes]:
+    """pos より手前で最後に現れたパート型トークン（b"IMAGE" など）を返す"""
+    last = None
+    for mt in _BS_PART_TYPE_RE.finditer(meta, 0, pos):
+        token = mt.group(1).upper()
+        if token not in _BS_PARAM_TOKENS:
+            last = token
+    return last
+
+
+def _bodystructure_filenames(meta: bytes) -> list[str]:
+    names = []
+    meta = meta or b""
+    for mt in _BS_FILENAME_RE.finditer(meta):
+        # image/* パートは _scan_message と同じくブロック判定の対象外。
+        # （image/png なのに .zip 名の添付を、本判定と食い違ってここで落とさないため）
+        if _part_type_before(meta, mt.start()) == b"IMAGE":
+            continue
+        name = _decode_mime_words(mt.group(1).decode("utf-8", errors="replace"))
+        if name:
+            names.append(name)
+    return names
+
+
+def _prefilter_headers(msg: email.message.Message, meta: bytes, conf) -> Optional[tuple[str, str]]:
+    """
+    ヘッダ + BODYSTRUCTURE だけで確実に除外できる場合に (reason, detail) を返す。
+    ここで判定できないメールは本文取得後に通常の filter_message で判定される。
+    """
+    # 添付拡張子（画像拡張子はブロック対象外）
+    for fname in _bodystructure_filenames(meta):
+        _, dot, ext = fname.rpartition(".")
+        ext = ext.lower() if dot else ""
+        if ext not in IMAGE_EXTS and ext in conf.blocked_exts:
+            return ("attachment", fname)
+
+    # 件名キーワード（件名ヒットなら本文を見るまでもなく除外確定）
+    to_half, unify_k, trim_sp = conf.norm_flags
+    subject_norm = normalize_text(_header_str(msg, "Subject"), to_half, unify_k, trim_sp)
+    kw = match_keyword(subject_norm, conf)
+    if kw is not None:
+        return ("keyword", kw)
+
+    return None
+
+
+def _save_text(uid: bytes, msg: email.message.Message, scan: ScanResult) -> str:
     d = _message_datetime(msg)
-    subj = _decode_header(msg.get("Subject"))
-    frm = _decode_header(msg.get("From"))
-    has_att = _has_attachments(msg)
-    body_parts = list(_iter_text_parts(msg))
-    body = "\n\n".join(body_parts).strip()
+    subj = _header_str(msg, "Subject")
+    frm = _header_str(msg, "From")
+    has_att = scan.has_attachments
+    body = _body_from_scan(scan).strip()
 
     # === ノイズ除外処理 ===
     body = reduce_noise(body)
@@ -179,66 +315,145 @@ def _save_text(uid: bytes, msg: email.message.Message) -> str:
         "-" * 60,
         "",
     ]
-    text = "\n".join(header_block) + body + "\n"
-    path.write_text(text, encoding="utf-8", newline="\n")
+    # ヘッダと本文を分けて書き出す（全体を1つの文字列に連結しない＝ピークメモリ半減）
+    with path.open("w", encoding="utf-8", newline="\n") as f:
+        f.write("\n".join(header_block))
+        f.write(body)
+        f.write("\n")
     return str(path)
 
 
-def main():
-    require_ready()
+def connect_and_login() -> imaplib.IMAP4_SSL:
+    """接続＋ログイン済みのIMAPセッションを返す（スケジューラの永続接続用）"""
+    m = _connect()
+    m.login(IMAP_USER, IMAP_PASS)
+    return m
 
-    ap = argparse.ArgumentParser(description="IMAP フェッチ → テキスト保存")
-    grp = ap.add_mutually_exclusive_group()
-    grp.add_argument("--all", action="store_true", help="ALL（既読/未読すべて）で検索")
-    ap.add_argument("--since", type=str, help="この日付以降 (YYYY-MM-DD)")
-    ap.add_argument("--days", type=int, help="直近N日 (例: --days 3)")
-    ap.add_argument("--limit", type=int, default=20, help="最大取得件数（新しい順）")
-    ap.add_argument("--dry-run", action="store_true", help="保存せず対象のみ一覧表示")
-    args = ap.parse_args()
 
-    with _connect() as m:
-        # ログイン & メールボックス選択（READ-ONLY 固定：副作用なし）
-        m.login(IMAP_USER, IMAP_PASS)
-        typ, _ = m.select(IMAP_MAILBOX, readonly=True)
-        if typ != "OK":
-            raise RuntimeError(f"メールボックス選択に失敗: {IMAP_MAILBOX}")
+def _run_fetch(m: imaplib.IMAP4_SSL, args) -> None:
+    # フィルタ設定は実行のたびに解決する（mtime キーのメモ化によりキャッシュヒット時は
+    # ほぼ無コスト。スケジューラの常駐プロセスでも設定編集が次の実行で反映される）
+    conf = prepared_filter_config()
 
-        uids = _search_uids(m, args)
-        print(f"検索条件: all={args.all}, since={args.since}, days={args.days}, limit={args.limit}")
-        print(f"対象UID数: {len(uids)}")
+    # メールボックス選択（READ-ONLY 固定：副作用なし）
+    typ, _ = m.select(IMAP_MAILBOX, readonly=True)
+    if typ != "OK":
+        raise RuntimeError(f"メールボックス選択に失敗: {IMAP_MAILBOX}")
 
-        saved = 0
-        for uid in uids:
-            typ, data = m.uid("FETCH", uid, "(RFC822)")
-            if typ != "OK" or not data or not isinstance(data[0], tuple):
-                print(f"[SKIP] FETCH失敗 uid={uid} resp={typ}")
-                continue
+    uids = _search_uids(m, args)
+    print(f"検索条件: all={args.all}, since={args.since}, days={args.days}, limit={args.limit}")
+    print(f"対象UID数: {len(uids)}")
+
+    # FETCH の発行方法を選択（--async-fetch かつ aioimaplib があれば並行発行）
+    use_async = args.async_fetch and aioimaplib is not None
+    if args.async_fetch and aioimaplib is None:
+        print("[WARN] aioimaplib が見つからないため同期FETCHで続行します")
+
+    def fetch(uid_list: list[bytes], parts: str = "(RFC822)"):
+        if use_async:
+            return _fetch_messages_async(uid_list, parts)
+        return _fetch_messages(m, uid_list, parts)
 
-            raw = data[0][1]
+    # --- dry-run：ヘッダだけ取得して一覧表示（本文はダウンロードしない） ---
+    if args.dry_run:
+        for uid, _meta, raw in fetch(uids, parts="(BODY.PEEK[HEADER])"):
             msg = email.message_from_bytes(raw, policy=email.policy.default)
+            d = _message_datetime(msg)
+            subj = _header_str(msg, "Subject")
+            frm = _header_str(msg, "From")
+            print(f"[DRY] {d:%Y-%m-%d %H:%M:%S} UID={uid.decode()} From={frm} Subj={subj}")
+        print("保存件数: 0")
+        return
+
+    # === フィルタ判定キャッシュ：毎分実行で同じ未読メールを再判定しないため ===
+    cache = ResultCache(RESULT_CACHE_PATH)
+    conf_hash = config_hash(conf)
+    try:
+        # === ヘッダ事前判定：件名・添付だけで除外確定できるメールは本文を取得しない ===
+        if not args.deep_scan:
+            survivors: list[bytes] = []
+            for uid, meta, raw in fetch(uids, parts="(BODY.PEEK[HEADER] BODYSTRUCTURE)"):
+                msg = email.message_from_bytes(raw, policy=email.policy.default)
+                cached = cache.get(_header_str(msg, "Message-ID"), conf_hash)
+                if cached is not None:
+                    pass_ok, reason, detail = cached
+                    if not pass_ok:
+                        # 前回実行時にCSVへ記録済みなので再追記しない
+                        print(f"[DROP] UID={uid.decode()} reason={reason} detail={detail} (cached)")
+                        continue
+                    survivors.append(uid)  # 通過済み→本文取得へ（保存は冪等）
+                    continue
+                hit = _prefilter_headers(msg, meta, conf)
+                if hit:
+                    reason, detail = hit
+                    cache.put(_header_str(msg, "Message-ID"), conf_hash, False, reason, detail)
+                    append_excluded(uid, msg, reason=reason, detail=detail)
+                    print(f"[DROP] UID={uid.decode()} reason={reason} detail={detail} Subj={_header_str(msg, 'Subject')}")
+                    continue
+                survivors.append(uid)
+            uids = survivors
 
-            # --- dry-run 表示のみ ---
-            if args.dry_run:
-                d = _message_datetime(msg)
-                subj = _decode_header(msg.get("Subject"))
-                frm = _decode_header(msg.get("From"))
-                print(f"[DRY] {d:%Y-%m-%d %H:%M:%S} UID={uid.decode()} From={frm} Subj={subj}")
-                continue
+        saved = 0
+        for uid, _meta, raw in fetch(uids):
+            msg = email.message_from_bytes(raw, policy=email.policy.default)
 
             # === フィルタリング（保存前に判定） ===
-            res = filter_message(msg, FILTER_CONF)
-            if not res.pass_through:
-                # ▼ ここが 2-2: 目視確認用のCSVに追記してから除外
-                append_excluded(uid, msg, reason=res.reason or "", detail=res.detail)
-                print(f"[DROP] UID={uid.decode()} reason={res.reason} detail={res.detail} Subj={_decode_header(msg.get('Subject'))}")
+            # 走査は1回だけ行い、フィルタ判定と保存処理で共有する
+            scan = _scan_message(msg, conf.blocked_exts)
+            msg_id = _header_str(msg, "Message-ID")
+            cached = cache.get(msg_id, conf_hash)
+            if cached is not None:
+                pass_ok, reason, detail = cached
+            else:
+                res = filter_message(msg, conf, scan=scan)
+                pass_ok, reason, detail = res.pass_through, res.reason, res.detail
+                cache.put(msg_id, conf_hash, pass_ok, reason, detail)
+            if not pass_ok:
+                # ▼ ここが 2-2: 目視確認用のCSVに追記してから除外（キャッシュヒット時は記録済み）
+                if cached is None:
+                    append_excluded(uid, msg, reason=reason or "", detail=detail)
+                print(f"[DROP] UID={uid.decode()} reason={reason} detail={detail} Subj={_header_str(msg, 'Subject')}")
                 continue
             # === フィルタ通過：案件メールのみ保存 ===
 
-            p = _save_text(uid, msg)
+            p = _save_text(uid, msg, scan)
             print(f"[SAVE] {p}")
             saved += 1
+    finally:
+        cache.close()
+
+    print(f"保存件数: {saved}")
+
 
-        print(f"保存件数: {saved}")
+def main(argv: Optional[list[str]] = None, conn: Optional[imaplib.IMAP4_SSL] = None):
+    """
+    argv: テスト・スケジューラから引数を渡す用（None なら sys.argv）。
+    conn: ログイン済みの永続IMAP接続。渡された場合は logout せず呼び出し側が管理する
+          （スケジューラが毎回のTLS接続＋LOGINを省くための口）。
+    """
+    require_ready()
+
+    ap = argparse.ArgumentParser(description="IMAP フェッチ → テキスト保存")
+    grp = ap.add_mutually_exclusive_group()
+    grp.add_argument("--all", action="store_true", help="ALL（既読/未読すべて）で検索")
+    ap.add_argument("--since", type=str, help="この日付以降 (YYYY-MM-DD)")
+    ap.add_argument("--days", type=int, help="直近N日 (例: --days 3)")
+    ap.add_argument("--limit", type=int, default=20, help="最大取得件数（新しい順）")
+    ap.add_argument("--dry-run", action="store_true", help="保存せず対象のみ一覧表示")
+    ap.add_argument("--deep-scan", action="store_true",
+                    help="ヘッダ事前判定を行わず、全メールを本文ごと取得してから判定")
+    ap.add_argument("--async-fetch", action="store_true",
+                    help="aioimaplib でFETCHバッチを並行発行（要 aioimaplib）")
+    args = ap.parse_args(argv)
+
+    if conn is not None:
+        _run_fetch(conn, args)
+        return
+
+    with _connect() as m:
+        # ログイン & 取得実行（単発実行時は接続を使い捨て）
+        m.login(IMAP_USER, IMAP_PASS)
+        _run_fetch(m, args)
 
 
 if __name__ == "__main__":
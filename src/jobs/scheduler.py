@@ -1,4 +1,5 @@
 # src/jobs/scheduler.py
+import imaplib
 import os
 import time
 import subprocess
@@ -7,20 +8,57 @@ from datetime import datetime
 from loguru import logger
 import schedule
 
+from src.jobs import imap_fetch
+
 # ===== 設定 =====
 # 本番スケジュール（JST）
 SCHEDULE_TIMES = ["10:00", "13:00", "16:00"]
 
 # テストモード：True にすると毎分実行（まずは True で動作確認をおすすめ）
 TEST_MODE = True
+
+# True にするとサブプロセス起動に戻す（クラッシュ隔離優先。
+# 毎回 import・設定読込・TLS接続・LOGIN をやり直すため遅い）
+USE_SUBPROCESS = False
 # =================
 
 # ログ設定（logs/ にローテーション保存）
+# インプロセス実行では mail_filter がフィルタ専用シンク（task=filtering）を登録するため、
+# こちらのシンクはフィルタ判定レコードを除外して scheduler.log / コンソールを分離する
+def _not_filtering(record):
+    return record["extra"].get("task") != "filtering"
+
+
 os.makedirs("logs", exist_ok=True)
-logger.add("logs/scheduler.log", rotation="1 week", retention="4 weeks", encoding="utf-8")
+# mail_filter の import 時に loguru 既定の stderr シンクが外れるため、ここで追加し直す
+logger.add(sys.stderr, filter=_not_filtering)
+logger.add("logs/scheduler.log", rotation="1 week", retention="4 weeks", encoding="utf-8",
+           filter=_not_filtering)
 
-def run_imap_fetch():
-    """既存の imap_fetch.py を -m で起動"""
+# インプロセス実行用の永続IMAP接続（初回実行時に確立し、切断されるまで使い回す）
+_imap_conn: imaplib.IMAP4_SSL | None = None
+
+
+def _get_conn() -> imaplib.IMAP4_SSL:
+    global _imap_conn
+    if _imap_conn is None:
+        _imap_conn = imap_fetch.connect_and_login()
+        logger.info("[scheduler] IMAP接続を確立しました（以後使い回し）")
+    return _imap_conn
+
+
+def _drop_conn():
+    global _imap_conn
+    if _imap_conn is not None:
+        try:
+            _imap_conn.logout()
+        except Exception:
+            pass
+        _imap_conn = None
+
+
+def _run_imap_fetch_subprocess():
+    """既存の imap_fetch.py を -m で起動（USE_SUBPROCESS=True 用）"""
     logger.info("[scheduler] imap_fetch を起動します")
     try:
         completed = subprocess.run(
@@ -37,6 +75,30 @@ def run_imap_fetch():
     except Exception as e:
         logger.exception(f"[scheduler] imap_fetch 実行中に例外: {e}")
 
+
+def run_imap_fetch():
+    """imap_fetch をインプロセスで実行（import・設定・IMAP接続を使い回す）"""
+    if USE_SUBPROCESS:
+        _run_imap_fetch_subprocess()
+        return
+
+    logger.info("[scheduler] imap_fetch を実行します（インプロセス）")
+    try:
+        imap_fetch.main(argv=[], conn=_get_conn())
+        logger.info("[scheduler] imap_fetch 終了")
+    except imaplib.IMAP4.abort as e:
+        # サーバー側から切断された：接続を作り直して1回だけ再試行
+        logger.warning(f"[scheduler] IMAP接続が切断されたため再接続します: {e!r}")
+        _drop_conn()
+        try:
+            imap_fetch.main(argv=[], conn=_get_conn())
+            logger.info("[scheduler] imap_fetch 終了（再接続後）")
+        except Exception as e2:
+            logger.exception(f"[scheduler] 再接続後も失敗: {e2}")
+            _drop_conn()
+    except Exception as e:
+        logger.exception(f"[scheduler] imap_fetch 実行中に例外: {e}")
+
 def main():
     logger.info("=== スケジューラ起動 ===")
     logger.info(f"起動時刻: {datetime.now().isoformat(timespec='seconds')}")
@@ -56,6 +118,7 @@ def main():
     except KeyboardInterrupt:
         logger.info("Ctrl+C でスケジューラを停止しました。")
     finally:
+        _drop_conn()
         logger.info("=== スケジューラ停止 ===")
 
 if __name__ == "__main__":
@@ -4,27 +4,14 @@ import csv
 from pathlib import Path
 import datetime as dt
 import email
-from typing import Optional
 
 BASE_DIR = Path(__file__).resolve().parents[2]
 REVIEW_DIR = BASE_DIR / "data" / "review"
 REVIEW_DIR.mkdir(parents=True, exist_ok=True)
 
-def _decode_header(value: Optional[str]) -> str:
-    import email.header
-    if not value:
-        return ""
-    parts = email.header.decode_header(value)
-    out = []
-    for text, enc in parts:
-        if isinstance(text, bytes):
-            try:
-                out.append(text.decode(enc or "utf-8", errors="replace"))
-            except LookupError:
-                out.append(text.decode("utf-8", errors="replace"))
-        else:
-            out.append(text)
-    return "".join(out).strip()
+def _header_str(msg: email.message.Message, name: str) -> str:
+    """policy=default でパース済みメッセージのヘッダをデコード済み str で返す"""
+    return str(msg.get(name) or "").strip()
 
 def _message_datetime(msg: email.message.Message) -> dt.datetime:
     raw = msg.get("Date")
@@ -48,8 +35,8 @@ def append_excluded(uid: bytes, msg: email.message.Message, reason: str, detail:
         "logged_at": dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "uid": uid.decode(),
         "date": d.strftime("%Y-%m-%d %H:%M:%S"),
-        "from": _decode_header(msg.get("From")),
-        "subject": _decode_header(msg.get("Subject")),
+        "from": _header_str(msg, "From"),
+        "subject": _header_str(msg, "Subject"),
         "reason": reason,
         "detail": detail or "",
     }